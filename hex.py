@@ -49,8 +49,19 @@ class HexState:
             return 0
 
 
+def hex_rollout(state):
+    if state.isTerminal():
+        return state.getReward()
+
+    if state.sim.random_rollout() == state.player:
+        return 1
+    else:
+        return -1
+
+
 def make_init(board_size=5, first_player=1):
-    sim = HexGame(first_player, player.EMPTY * np.ones((board_size, board_size)))
+    sim = HexGame(first_player,
+                  np.full(board_size ** 2, player.EMPTY, dtype=np.int8))
     return HexState(sim)
 
 
@@ -59,8 +70,8 @@ def run_game(board_size=5, iters=100):
 
     transcript = []
 
-    player_1 = Mcts(iterationLimit=iters)
-    player_0 = Mcts(iterationLimit=iters)
+    player_1 = Mcts(iterationLimit=iters, rolloutPolicy=hex_rollout)
+    player_0 = Mcts(iterationLimit=iters, rolloutPolicy=hex_rollout)
 
     p1_mv = player_1.start(init_state)['action']
     next_state = player_1.root.children[p1_mv].state.flip()
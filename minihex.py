@@ -23,10 +23,15 @@ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
+import math
+import os
+
 import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
 from enum import IntEnum
+import numba
+from numba import njit, prange
 
 
 class player(IntEnum):
@@ -35,6 +40,219 @@ class player(IntEnum):
     EMPTY = 2
 
 
+_RNG = np.random.default_rng()
+
+
+def _reseed_rng():
+    global _RNG
+    _RNG = np.random.default_rng()
+
+
+# forked workers (e.g. the Pool in hex.py) would otherwise share one stream;
+# spawned workers re-import the module and get a fresh _RNG anyway
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reseed_rng)
+
+
+# TBB's worker pool does not survive fork (hex.py forks a Pool), so unless
+# the caller picked a layer, run parallel kernels on the fork-safe workqueue
+if "NUMBA_THREADING_LAYER" not in os.environ:
+    numba.config.THREADING_LAYER = "workqueue"
+
+
+# hex neighbors of (y, x); (-1, -1) and (1, 1) are not adjacent
+_NEIGHBOR_OFFSETS = ((-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0))
+
+
+@njit(cache=True, boundscheck=False)
+def _find(parent, node):
+    # path halving
+    while parent[node] != node:
+        parent[node] = parent[parent[node]]
+        node = parent[node]
+    return node
+
+
+@njit(cache=True, boundscheck=False)
+def _link(parent, rank, a, b):
+    """
+    Join two distinct roots by rank and return the root of the union.
+    """
+    if rank[a] < rank[b]:
+        a, b = b, a
+    parent[b] = a
+    if rank[a] == rank[b]:
+        rank[a] += 1
+    return a
+
+
+@njit(cache=True, boundscheck=False)
+def _union(parent, rank, a, b):
+    a = _find(parent, a)
+    b = _find(parent, b)
+    if a != b:
+        _link(parent, rank, a, b)
+
+
+@njit(cache=True, boundscheck=False)
+def _connect(board, parent, rank, action, color, neighbors):
+    # track the new stone's root so neighbors already in its group (at most
+    # three distinct groups touch a cell) cost a single find and no link
+    root = _find(parent, action)
+    for i in range(6):
+        neighbor = neighbors[action, i]
+        if neighbor < 0 or board[neighbor] != color:
+            continue
+
+        other = _find(parent, neighbor)
+        if other != root:
+            root = _link(parent, rank, root, other)
+
+
+@njit(cache=True, boundscheck=False)
+def _apply_move(board, parent, rank, action, color, neighbors):
+    """
+    Place a stone of `color` and return True if it connects color's edges.
+    """
+    board[action] = color
+
+    _connect(board, parent, rank, action, color, neighbors)
+    return _find(parent, len(parent) - 2) == _find(parent, len(parent) - 1)
+
+
+@njit(cache=True, boundscheck=False)
+def _xorshift(state):
+    state ^= state << np.uint64(13)
+    state ^= state >> np.uint64(7)
+    state ^= state << np.uint64(17)
+    return state
+
+
+@njit(cache=True, boundscheck=False)
+def _rollout(board, parent, rank, color, neighbors, seed):
+    """
+    Play uniformly random moves from `color`'s turn and return the winner,
+    or -1 if no move connects an edge pair (e.g. the board is already full).
+
+    board, parent and rank are updated in place; pass copies.
+    """
+    cells = np.empty(board.size, dtype=np.int32)
+    n_empty = 0
+    for action in range(board.size):
+        if board[action] == player.EMPTY:
+            cells[n_empty] = action
+            n_empty += 1
+
+    state = np.uint64(seed) | np.uint64(1)
+    for i in range(n_empty):
+        # draw the next move from the remaining cells (Fisher-Yates)
+        state = _xorshift(state)
+        j = i + np.int64(state % np.uint64(n_empty - i))
+        cells[i], cells[j] = cells[j], cells[i]
+
+        if _apply_move(board, parent[color], rank[color], cells[i], color,
+                       neighbors):
+            return color
+        color = 1 - color
+
+    return -1
+
+
+@njit(cache=True, boundscheck=False, parallel=True)
+def _batch_rollout(boards, parents, ranks, colors, neighbors, seeds):
+    """
+    _rollout over each row of the stacked game arrays, one lane per thread.
+    """
+    winners = np.empty(len(boards), dtype=np.int64)
+    for i in prange(len(boards)):
+        winners[i] = _rollout(boards[i], parents[i], ranks[i], colors[i],
+                              neighbors, seeds[i])
+    return winners
+
+
+# neighbor tables, keyed by board size
+_NEIGHBORS = {}
+
+
+def _neighbor_table(board_size):
+    """
+    (n * n, 6) table of the cells adjacent to each cell, -1 if off-board
+    """
+    if board_size not in _NEIGHBORS:
+        y, x = np.divmod(np.arange(board_size ** 2), board_size)
+        offsets = np.array(_NEIGHBOR_OFFSETS)
+        ny = y[:, None] + offsets[:, 0]
+        nx = x[:, None] + offsets[:, 1]
+        on_board = ((ny >= 0) & (ny < board_size)
+                    & (nx >= 0) & (nx < board_size))
+        _NEIGHBORS[board_size] = np.where(on_board, ny * board_size + nx,
+                                          -1).astype(np.int32)
+    return _NEIGHBORS[board_size]
+
+
+# (y, x) of every action, keyed by board size
+_COORDS = {}
+
+
+def _coordinate_table(board_size):
+    # a list of tuples indexes faster than an ndarray for single lookups
+    if board_size not in _COORDS:
+        _COORDS[board_size] = [divmod(action, board_size)
+                               for action in range(board_size ** 2)]
+    return _COORDS[board_size]
+
+
+# union-find arrays of the empty board, keyed by board size
+_INITIAL_CACHE = {}
+
+
+def _initial_connections(board_size):
+    if board_size not in _INITIAL_CACHE:
+        # one disjoint set per cell, plus two virtual nodes per color
+        # standing in for that color's opposing edges of the board
+        n_nodes = board_size ** 2 + 2
+        parent = np.tile(np.arange(n_nodes, dtype=np.int32), (2, 1))
+        # union by rank keeps every rank below log2(n_nodes), well in int8
+        rank = np.zeros((2, n_nodes), dtype=np.int8)
+
+        edges = np.arange(board_size ** 2).reshape(board_size, board_size)
+        for first, second in zip(edges[:, 0], edges[:, -1]):
+            _union(parent[player.WHITE], rank[player.WHITE],
+                   n_nodes - 2, first)
+            _union(parent[player.WHITE], rank[player.WHITE],
+                   n_nodes - 1, second)
+        for first, second in zip(edges[0, :], edges[-1, :]):
+            _union(parent[player.BLACK], rank[player.BLACK],
+                   n_nodes - 2, first)
+            _union(parent[player.BLACK], rank[player.BLACK],
+                   n_nodes - 1, second)
+
+        _INITIAL_CACHE[board_size] = (parent, rank)
+    return _INITIAL_CACHE[board_size]
+
+
+# Zobrist keys per (cell, color), keyed by board size
+_ZOBRIST = {}
+
+
+def _zobrist_table(board_size):
+    if board_size not in _ZOBRIST:
+        # fixed seed so hashes agree across processes and runs
+        _ZOBRIST[board_size] = np.random.default_rng(0).integers(
+            0, 2 ** 63, size=(board_size ** 2, 2), dtype=np.uint64)
+    return _ZOBRIST[board_size]
+
+
+# compile the kernels at import rather than on the first move; the parallel
+# _batch_rollout is left to compile on first use so that merely importing
+# this module never starts numba's thread pool
+_apply_move(np.full(1, 2, dtype=np.int8), np.arange(3, dtype=np.int32),
+            np.zeros(3, dtype=np.int8), 0, 0, _neighbor_table(1))
+_rollout(np.full(1, 2, dtype=np.int8),
+         np.tile(np.arange(3, dtype=np.int32), (2, 1)),
+         np.zeros((2, 3), dtype=np.int8), 0, _neighbor_table(1), 1)
+
+
 class HexGame(object):
     """
     Hex Game Environment.
@@ -42,9 +260,24 @@ class HexGame(object):
 
     def __init__(self, active_player, board,
                  connected_stones=None, debug=False):
-        self.board = board
+        # flat int8 board, row-major; use board.reshape(n, n) for 2-D access
+        self.board = np.asarray(board, dtype=np.int8).reshape(-1)
+        self.board_size = math.isqrt(self.board.size)
+        self.neighbors = _neighbor_table(self.board_size)
+        self.coords = _coordinate_table(self.board_size)
+
+        # the one scan of the board; everything below derives from it
+        stones = np.flatnonzero(self.board != player.EMPTY)
         # track number of empty fields for speed
-        self.empty_fields = np.count_nonzero(board == player.EMPTY)
+        self.empty_fields = self.board.size - len(stones)
+
+        # Zobrist hashes of the position and of its 180 degree rotation,
+        # kept up to date by fast_move
+        self.zobrist = _zobrist_table(self.board_size)
+        self.hash = int(np.bitwise_xor.reduce(
+            self.zobrist[stones, self.board[stones]]))
+        self.rotated_hash = int(np.bitwise_xor.reduce(
+            self.zobrist[-1 - stones, self.board[stones]]))
 
         if debug:
             self.make_move = self.make_move_debug
@@ -57,55 +290,50 @@ class HexGame(object):
         # })
 
         if connected_stones is None:
-            self.regions = np.stack([
-                np.pad(np.zeros_like(self.board), 1),
-                np.pad(np.zeros_like(self.board), 1)
-            ], axis=0)
-            self.regions[player.WHITE][:, 0] = 1
-            self.regions[player.BLACK][0, :] = 1
-            self.regions[player.WHITE][:, self.board_size + 1] = 2
-            self.regions[player.BLACK][self.board_size + 1, :] = 2
+            parent, rank = _initial_connections(self.board_size)
+            self.parent = parent.copy()
+            self.rank = rank.copy()
+
+            # only stones need replaying; an empty board is done already
+            for action in stones:
+                self.active_player = player(self.board[action])
+                self.connect(action)
         else:
-            self.regions = connected_stones
-
-        self.region_counter = np.zeros(2)
-        self.region_counter[player.BLACK] = np.max(self.regions[player.BLACK]) + 1
-        self.region_counter[player.WHITE] = np.max(self.regions[player.WHITE]) + 1
-
-        if connected_stones is None:
-            for y, row in enumerate(board):
-                for x, value in enumerate(row):
-                    if value == player.BLACK:
-                        self.active_player = player.BLACK
-                        self.flood_fill((y, x))
-                    elif value == player.WHITE:
-                        self.active_player = player.WHITE
-                        self.flood_fill((y, x))
+            self.parent, self.rank = connected_stones
 
         self.active_player = active_player
         self.done = False
         self.winner = None
-
-        self.actions = np.arange(self.board_size ** 2)
     
     def copy(self):
-        game = HexGame(
-            active_player=self.active_player,
-            board=self.board.copy(),
-            connected_stones=self.regions.copy(),
-        )
-
+        # skip __init__: everything it derives is already known here
+        game = object.__new__(HexGame)
+        game.board = self.board.copy()
+        game.board_size = self.board_size
+        game.neighbors = self.neighbors
+        game.coords = self.coords
+        game.empty_fields = self.empty_fields
+        game.zobrist = self.zobrist
+        game.hash = self.hash
+        game.rotated_hash = self.rotated_hash
+        game.make_move = game.fast_move
+        game.parent = self.parent.copy()
+        game.rank = self.rank.copy()
+        game.active_player = self.active_player
         game.done = self.done
         game.winner = self.winner
         return game
 
     @property
-    def board_size(self):
-        return self.board.shape[1]
+    def canonical_hash(self):
+        """
+        Hash shared by a position and its 180 degree rotation, which is
+        the same game for both players.
+        """
+        return min(self.hash, self.rotated_hash)
 
     def is_valid_move(self, action):
-        coords = self.action_to_coordinate(action)
-        return self.board[coords[0], coords[1]] == player.EMPTY
+        return self.board[action] == player.EMPTY
 
     def make_move_debug(self, action):
         if not self.is_valid_move(action):
@@ -121,14 +349,16 @@ class HexGame(object):
         #     self.winner = (self.active_player + 1) % 2
         #     return (self.active_player + 1) % 2
 
-        y, x = self.action_to_coordinate(action)
-        self.board[y, x] = self.active_player
+        won = _apply_move(self.board,
+                          self.parent[self.active_player],
+                          self.rank[self.active_player],
+                          action, int(self.active_player),
+                          self.neighbors)
         self.empty_fields -= 1
+        self.hash ^= int(self.zobrist[action, self.active_player])
+        self.rotated_hash ^= int(self.zobrist[-1 - action, self.active_player])
 
-        self.flood_fill((y, x))
-
-        regions = self.regions[self.active_player]
-        if regions[-1, -1] == 1:
+        if won:
             self.done = True
             self.winner = player(self.active_player)
         elif self.empty_fields <= 0:
@@ -141,33 +371,65 @@ class HexGame(object):
         return np.ravel_multi_index(coords, (self.board_size, self.board_size))
 
     def action_to_coordinate(self, action):
-        y = action // self.board_size
-        x = action - self.board_size * y
-        return (y, x)
+        return self.coords[action]
 
     def get_possible_actions(self):
-        return self.actions[self.board.flatten() == player.EMPTY]
+        return np.flatnonzero(self.board == player.EMPTY)
 
-    def flood_fill(self, position):
-        regions = self.regions[self.active_player]
+    def connect(self, action):
+        _connect(self.board,
+                 self.parent[self.active_player],
+                 self.rank[self.active_player],
+                 action, int(self.active_player), self.neighbors)
 
-        y, x = (position[0] + 1, position[1] + 1)
-        neighborhood = regions[(y - 1):(y + 2), (x - 1):(x + 2)].copy()
-        neighborhood[0, 0] = 0
-        neighborhood[2, 2] = 0
-        adjacent_regions = sorted(set(neighborhood.flatten().tolist()))
+    def random_rollout(self):
+        """
+        Winner of a uniformly random playout from this position.
 
-        ## region label = 0 is always present, but not a region
-        adjacent_regions.pop(0)
+        Positions where no move can win (e.g. a full board passed to
+        __init__, which never sets done) return self.winner unchanged.
+        """
+        if self.done:
+            return self.winner
 
-        if len(adjacent_regions) == 0:
-            regions[y, x] = self.region_counter[self.active_player]
-            self.region_counter[self.active_player] += 1
-        else:
-            new_region_label = adjacent_regions.pop(0)
-            regions[y, x] = new_region_label
-            for label in adjacent_regions:
-                regions[regions == label] = new_region_label
+        winner = _rollout(self.board.copy(), self.parent.copy(),
+                          self.rank.copy(), int(self.active_player),
+                          self.neighbors, _RNG.integers(1, 2 ** 63))
+        if winner < 0:
+            return self.winner
+        return player(winner)
+
+
+def batch_rollout(games):
+    """
+    Winners of one uniformly random playout from each game, run in parallel.
+
+    All games must share a board size; the games themselves are unchanged.
+    This is a module-level function rather than a HexEnv method because a
+    HexEnv only ever drives a single game.
+
+    The kernel runs on numba's fork-safe workqueue threading layer. If
+    NUMBA_THREADING_LAYER selects tbb instead, do not call this in a process
+    that later forks workers (e.g. the Pool in hex.py): it will hang.
+    """
+    winners = [game.winner for game in games]
+    live = [i for i, game in enumerate(games) if not game.done]
+    if not live:
+        return winners
+
+    batch = [games[i] for i in live]
+    results = _batch_rollout(
+        np.stack([game.board for game in batch]),
+        np.stack([game.parent for game in batch]),
+        np.stack([game.rank for game in batch]),
+        np.array([game.active_player for game in batch], dtype=np.int64),
+        batch[0].neighbors,
+        _RNG.integers(1, 2 ** 63, size=len(batch)))
+
+    for i, winner in zip(live, results):
+        if winner >= 0:
+            winners[i] = player(winner)
+    return winners
 
 
 class HexEnv(gym.Env):
@@ -187,9 +449,8 @@ class HexEnv(gym.Env):
         self.opponent_policy = opponent_policy
 
         if board is None:
-            board = player.EMPTY * np.ones((board_size, board_size))
+            board = np.full(board_size ** 2, player.EMPTY, dtype=np.int8)
 
-        self.initial_board = board
         self.active_player = active_player
         self.player = player_color
         self.simulator = None
@@ -197,26 +458,19 @@ class HexEnv(gym.Env):
         self.previous_opponent_move = None
         self.debug = debug
 
-        # cache initial connection matrix (approx +100 games/s)
-        self.initial_regions = regions
+        # the starting position; every reset clones this game instead of
+        # constructing a new one
+        self.initial_game = HexGame(self.active_player, board.copy(),
+                                    connected_stones=regions)
 
     @property
     def opponent(self):
         return player((self.player + 1) % 2)
 
     def reset(self):
-        if self.initial_regions is None:
-            self.simulator = HexGame(self.active_player,
-                                     self.initial_board.copy(),
-                                     debug=self.debug)
-            regions = self.simulator.regions.copy()
-            self.initial_regions = regions
-        else:
-            regions = self.initial_regions.copy()
-            self.simulator = HexGame(self.active_player,
-                                     self.initial_board.copy(),
-                                     connected_stones=regions,
-                                     debug=self.debug)
+        self.simulator = self.initial_game.copy()
+        if self.debug:
+            self.simulator.make_move = self.simulator.make_move_debug
 
         self.previous_opponent_move = None
 
@@ -267,30 +521,7 @@ class HexEnv(gym.Env):
                 self.simulator.done, info)
 
     def render(self, mode='ansi', close=False):
-        board = self.simulator.board
-        print(" " * 6, end="")
-        for j in range(board.shape[1]):
-            print(" ", j + 1, " ", end="")
-            print("|", end="")
-        print("")
-        print(" " * 5, end="")
-        print("-" * (board.shape[1] * 6 - 1), end="")
-        print("")
-        for i in range(board.shape[1]):
-            print(" " * (1 + i * 3), i + 1, " ", end="")
-            print("|", end="")
-            for j in range(board.shape[1]):
-                if board[i, j] == player.EMPTY:
-                    print("  O  ", end="")
-                elif board[i, j] == player.BLACK:
-                    print("  B  ", end="")
-                else:
-                    print("  W  ", end="")
-                print("|", end="")
-            print("")
-            print(" " * (i * 3 + 1), end="")
-            print("-" * (board.shape[1] * 7 - 1), end="")
-            print("")
+        print_board(self.simulator.board)
 
     def opponent_move(self, info):
         opponent_action = self.opponent_policy(self.simulator.board,
@@ -301,33 +532,23 @@ class HexEnv(gym.Env):
         return opponent_action
 
 
+# cell glyphs, indexed by player value
+_CELL = np.array(["  B  ", "  W  ", "  O  "])
+
+
 def print_board(board):
-    print(" " * 6, end="")
-    for j in range(board.shape[1]):
-        print(" ", j + 1, " ", end="")
-        print("|", end="")
-    print("")
-    print(" " * 5, end="")
-    print("-" * (board.shape[1] * 6 - 1), end="")
-    print("")
-    for i in range(board.shape[1]):
-        print(" " * (1 + i * 3), i + 1, " ", end="")
-        print("|", end="")
-        for j in range(board.shape[1]):
-            if board[i, j] == player.EMPTY:
-                print("  O  ", end="")
-            elif board[i, j] == player.BLACK:
-                print("  B  ", end="")
-            else:
-                print("  W  ", end="")
-            print("|", end="")
-        print("")
-        print(" " * (i * 3 + 1), end="")
-        print("-" * (board.shape[1] * 7 - 1), end="")
-        print("")
+    board_size = math.isqrt(board.size)
+    cells = _CELL[board.reshape(board_size, board_size)]
+
+    lines = [
+        " " * 6 + "".join(f"  {j + 1}  |" for j in range(board_size)),
+        " " * 5 + "-" * (board_size * 6 - 1)
+    ]
+    for i, row in enumerate(cells):
+        lines.append(" " * (1 + i * 3) + f" {i + 1}  |" + "|".join(row) + "|")
+        lines.append(" " * (i * 3 + 1) + "-" * (board_size * 7 - 1))
+    print("\n".join(lines))
 
 def random_policy(board, player, info):
-    actions = np.arange(board.shape[0] * board.shape[1])
-    valid_actions = actions[board.flatten() == player.EMPTY]
-    choice = int(np.random.random() * len(valid_actions))
-    return valid_actions[choice]
\ No newline at end of file
+    valid_actions = np.flatnonzero(board == player.EMPTY)
+    return valid_actions[_RNG.integers(valid_actions.size)]
\ No newline at end of file